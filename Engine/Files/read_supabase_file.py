@@ -1,13 +1,27 @@
 import os
 import requests
 from Engine.Files.auth import get_supabase_headers
+from Engine.Files.session import supabase_session
 from logger import logger
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_BUCKET = "panelitix"
 SUPABASE_ROOT_FOLDER = os.getenv("SUPABASE_ROOT_FOLDER", "JSON_to_csv")  # 🔹 Add this line
 
-def read_supabase_file(path: str, binary: bool = False):
+def _is_missing(response) -> bool:
+    # Storage reports a missing object as 404, or (older API versions) as 400 with a not_found body
+    if response.status_code == 404:
+        return True
+    if response.status_code == 400:
+        try:
+            body = response.json()
+        except ValueError:
+            return False
+        return isinstance(body, dict) and (str(body.get("statusCode")) == "404" or body.get("error") == "not_found")
+    return False
+
+def read_supabase_file(path: str, binary: bool = False, missing_ok: bool = False):
+    # missing_ok=True: a missing object returns None (logged at DEBUG) instead of raising
     if not SUPABASE_URL:
         logger.error("❌ SUPABASE_URL is not set in environment variables.")
         raise ValueError("SUPABASE_URL not configured")
@@ -20,9 +34,12 @@ def read_supabase_file(path: str, binary: bool = False):
 
     try:
         logger.info(f"📥 Reading Supabase file from: {url}")
-        response = requests.get(url, headers=headers)
+        response = supabase_session.get(url, headers=headers)
 
         logger.info(f"🛰️ Supabase response status: {response.status_code}")
+        if missing_ok and _is_missing(response):
+            logger.debug(f"ℹ️ No Supabase file at: {full_path}")
+            return None
         logger.debug(f"📄 Supabase Content-Type header: {response.headers.get('Content-Type')}")
         response.raise_for_status()
 
@@ -47,3 +64,35 @@ def read_supabase_file(path: str, binary: bool = False):
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Supabase file read failed: {e}")
         raise
+
+def read_supabase_file_stream(path: str, chunk_size: int = 64 * 1024, absolute: bool = False):
+    """
+    Streaming counterpart of read_supabase_file().
+
+    Yields the raw response body in `chunk_size` byte chunks as it arrives instead of
+    returning the fully buffered (and decoded) content, so callers can write straight
+    into their own sink without holding an extra copy of the payload. Nothing is
+    decoded here. HTTP errors are raised on the first iteration, and the connection
+    is released once the generator is exhausted or closed.
+
+    With `absolute=True`, `path` is the full object path within the bucket and
+    SUPABASE_ROOT_FOLDER is not prepended.
+    """
+    if not SUPABASE_URL:
+        logger.error("❌ SUPABASE_URL is not set in environment variables.")
+        raise ValueError("SUPABASE_URL not configured")
+
+    full_path = path if absolute else f"{SUPABASE_ROOT_FOLDER}/{path}"
+    url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{full_path}"
+    headers = get_supabase_headers()
+
+    try:
+        logger.debug(f"📥 Streaming Supabase file from: {url}")
+        with supabase_session.get(url, headers=headers, stream=True) as response:
+            logger.debug(f"🛰️ Supabase response status: {response.status_code}")
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ Supabase file stream failed: {e}")
+        raise
@@ -0,0 +1,15 @@
+import requests
+from requests.adapters import HTTPAdapter
+from logger import logger
+
+# Shared keep-alive pool for Supabase storage calls, so each file read/write reuses an
+# open TCP/TLS connection instead of handshaking per request. Sized above the formatter's
+# worker count so concurrent threads don't queue for (or discard) connections.
+POOL_SIZE = 32
+
+supabase_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+supabase_session.mount("https://", _adapter)
+supabase_session.mount("http://", _adapter)
+
+logger.debug(f"🔌 Supabase HTTP session ready (pool size {POOL_SIZE}).")
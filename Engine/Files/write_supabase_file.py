@@ -1,6 +1,7 @@
 import os
 import requests
 from Engine.Files.auth import get_supabase_headers
+from Engine.Files.session import supabase_session
 from logger import logger
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -49,11 +50,23 @@ def write_supabase_file(path, content, content_type=None):
         data = content
         logger.debug("🖼️ Content is raw bytes. Uploading directly.")
         logger.debug(f"🔍 Preview of byte content (first 100 bytes): {data[:100]}")
+    elif hasattr(content, "read"):
+        # 🔹 Binary file object (e.g. a temp file): streamed from its current position,
+        # so the payload never has to be held in memory. Must be seekable so the
+        # Content-Length is known up front.
+        data = content
+        logger.debug("📂 Content is a file object. Streaming upload from file.")
     else:
-        logger.error("❌ Content must be either str or bytes.")
-        raise TypeError("Content must be str or bytes")
+        logger.error("❌ Content must be str, bytes or a binary file object.")
+        raise TypeError("Content must be str, bytes or a binary file object")
 
-    logger.info(f"📏 Upload size: {len(data)} bytes")
+    if isinstance(data, bytes):
+        size = len(data)
+    else:
+        start = data.tell()
+        size = data.seek(0, os.SEEK_END) - start
+        data.seek(start)
+    logger.info(f"📏 Upload size: {size} bytes")
 
     # --- Determine Content-Type ---
     if content_type:
@@ -74,7 +87,7 @@ def write_supabase_file(path, content, content_type=None):
     # --- Upload to Supabase ---
     try:
         logger.info(f"🚀 Initiating PUT request to Supabase at: {url}")
-        response = requests.put(url, headers=headers, data=data)
+        response = supabase_session.put(url, headers=headers, data=data)
 
         logger.info(f"📡 Supabase response status: {response.status_code}")
         logger.debug(f"📨 Supabase raw response: {response.text}")
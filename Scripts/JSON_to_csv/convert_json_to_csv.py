@@ -327,7 +327,10 @@ def convert_json_to_csv(_: dict) -> dict:
                     ordered_keys.append(key)
 
         output_stream = BytesIO()
-        workbook = xlsxwriter.Workbook(output_stream, {'in_memory': True})
+        # constant_memory flushes each row as soon as the next one starts (rows are written
+        # strictly in order below) instead of holding the whole sheet; note that it is
+        # ignored if combined with 'in_memory'
+        workbook = xlsxwriter.Workbook(output_stream, {'constant_memory': True})
         worksheet = workbook.add_worksheet()
 
         for col, key in enumerate(ordered_keys):
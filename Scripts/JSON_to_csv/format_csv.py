@@ -1,12 +1,19 @@
 import os
-import io
 import re
 import json
-from typing import Dict, Any, List, Tuple
+import logging
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, Any, List, Optional, Tuple
 
 import pandas as pd
 from supabase import create_client
 from logger import logger
+from Engine.Files.read_supabase_file import read_supabase_file, read_supabase_file_stream
 from Engine.Files.write_supabase_file import write_supabase_file
 
 # -----------------------------------------------------------
@@ -17,255 +24,565 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET = "panelitix"
 SUPABASE_ROOT_FOLDER = (os.getenv("SUPABASE_ROOT_FOLDER", "").strip("/"))  # e.g., "JSON_to_csv"
+_ROOT_PREFIX = f"{SUPABASE_ROOT_FOLDER}/" if SUPABASE_ROOT_FOLDER else ""
 
 INPUT_DIR_REL = "csv_Output_File/"
 OUTPUT_DIR_REL = "Formatted_csv_Output_File/"
 LIST_DIR_ABS = f"{SUPABASE_ROOT_FOLDER}/{INPUT_DIR_REL}" if SUPABASE_ROOT_FOLDER else INPUT_DIR_REL
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+EXCEL_EXTS = (".xlsx", ".xls")
+LIST_PAGE_SIZE = 1000  # explicit page size for storage listings (client default is 100)
+MAX_WORKERS = int(os.getenv("JSON_TO_CSV_WORKERS", "8"))  # concurrent files (download/parse/transform/serialize)
+UPLOAD_WORKERS = int(os.getenv("JSON_TO_CSV_UPLOAD_WORKERS", "4"))  # concurrent output uploads
+# BUNDLE_OUTPUTS=1: upload every output of a run as one zip (one PUT) instead of one object per file;
+# off by default since downstream consumers read the individual files
+BUNDLE_OUTPUTS = os.getenv("BUNDLE_OUTPUTS", "0").strip() == "1"
+# SKIP_UNCHANGED=1 (opt-in): inputs whose listing `updated_at` matches the manifest from a previous
+# run are skipped without downloading. The manifest lives outside the consumer-facing output folder.
+MANIFEST_REL = "format_csv_state/manifest.json"
+SKIP_UNCHANGED = os.getenv("SKIP_UNCHANGED", "0").strip() == "1"
+# Listed objects smaller than this can't be a workbook with data (real .xlsx files are ~4.5KB+),
+# so they're skipped without downloading
+MIN_INPUT_BYTES = int(os.getenv("MIN_INPUT_BYTES", "512"))
+# First-row reads use calamine up to this size and openpyxl read_only above it
+# (calamine parses the full sheet up front; the two break even around 20-30KB)
+CALAMINE_FIRST_ROW_MAX_BYTES = int(os.getenv("CALAMINE_FIRST_ROW_MAX_BYTES", str(32 * 1024)))
+
+# Output file format for the formatted sheets; xlsx keeps the existing downstream contract,
+# csv/parquet are much cheaper to serialize and upload
+OUT_FORMATS = ("xlsx", "csv", "parquet")
+OUT_FORMAT = os.getenv("OUT_FORMAT", "xlsx").strip().lower()
+if OUT_FORMAT not in OUT_FORMATS:
+    raise RuntimeError(f"❌ Invalid OUT_FORMAT: {OUT_FORMAT!r} — must be one of {OUT_FORMATS}")
+
+@lru_cache(maxsize=1)
+def _bucket():
+    # Client + bucket proxy are created on first listing rather than at import,
+    # then reused for every call
+    return create_client(SUPABASE_URL, SUPABASE_KEY).storage.from_(SUPABASE_BUCKET)
 
 try:
-    import openpyxl  # noqa: F401
+    import openpyxl
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    from openpyxl.utils.escape import unescape as xml_unescape
     from openpyxl import __version__ as _oxl_ver
     logger.info(f"✅ openpyxl loaded: v{_oxl_ver}")
 except Exception:
-    logger.error("❌ openpyxl is required to read .xlsx files. Add `openpyxl>=3.1.2` to requirements.")
+    logger.error("❌ openpyxl is required to write .xlsx files. Add `openpyxl>=3.1.2` to requirements.")
     raise
 
+# Rust-backed reader for inputs; openpyxl remains the fallback reader when it's missing
+try:
+    from python_calamine import CalamineWorkbook
+    XLSX_READ_ENGINE = "calamine"
+except ImportError:
+    CalamineWorkbook = None
+    XLSX_READ_ENGINE = "openpyxl"
+    logger.info("ℹ️ python-calamine not installed; reading workbooks with openpyxl.")
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    if OUT_FORMAT == "parquet":
+        raise RuntimeError("❌ OUT_FORMAT=parquet requires pyarrow, which is not installed")
+    STRING_DTYPE = pd.StringDtype("python")
+    logger.info("ℹ️ pyarrow not installed; output text columns use python-backed string dtype.")
+
+# Fixed part of the output schema, resolved once at import
+KEY_DTYPES = {"section_number": pd.Int64Dtype(), "sub_section_number": pd.Float64Dtype()}
+INT64_MAX = 2**63 - 1
+
 # -----------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------
 
 def _as_rel(path: str) -> str:
-    if not SUPABASE_ROOT_FOLDER:
-        return path.lstrip("/")
-    prefix = f"{SUPABASE_ROOT_FOLDER}/"
-    return path[len(prefix):] if path.startswith(prefix) else path
+    # removeprefix("") is a no-op, so no branch on whether a root folder is configured
+    return path.removeprefix(_ROOT_PREFIX).lstrip("/")
 
 def _to_abs(rel_path: str) -> str:
-    rel_path = rel_path.lstrip("/")
-    return f"{SUPABASE_ROOT_FOLDER}/{rel_path}" if SUPABASE_ROOT_FOLDER else rel_path
+    return f"{_ROOT_PREFIX}{rel_path.lstrip('/')}"
 
 def list_folder(abs_prefix: str):
-    logger.info(f"📂 Listing: {abs_prefix}")
-    return supabase.storage.from_(SUPABASE_BUCKET).list(abs_prefix) or []
-
-def read_xlsx_from_supabase(rel_path: str) -> pd.DataFrame:
+    # Generator: yields entries page by page so callers can start on the first page
+    # while later pages are still to be fetched. Stops on the first short page.
+    offset = 0
+    while True:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📂 Listing: {abs_prefix} (limit={LIST_PAGE_SIZE}, offset={offset})")
+        page = _bucket().list(abs_prefix, {"limit": LIST_PAGE_SIZE, "offset": offset}) or []
+        yield from page
+        if len(page) < LIST_PAGE_SIZE:
+            break
+        offset += LIST_PAGE_SIZE
+
+def download_xlsx_from_supabase(rel_path: str):
+    # Returns a named temp file holding the object; use as a context manager
+    # Fetched by the same root-prefixed path that list_folder() lists under
     rel_path = _as_rel(rel_path)
     abs_path = _to_abs(rel_path)
-    logger.info(f"📥 Downloading (abs): {abs_path}")
-    raw: bytes = supabase.storage.from_(SUPABASE_BUCKET).download(abs_path)
-    bio = io.BytesIO(raw)
-    df = pd.read_excel(bio, engine="openpyxl")
-    logger.info(f"📄 Input sheet shape: {df.shape}. First 5 headers: {list(df.columns)[:5]}")
-    return df
-
-def write_xlsx_to_supabase(df: pd.DataFrame, rel_path: str) -> None:
-    rel_path = _as_rel(rel_path)
-    base, _ext = os.path.splitext(rel_path)
-    rel_xlsx = f"{base}.xlsx"
-    logger.info(f"💾 Writing XLSX (rel): {rel_xlsx} with shape {df.shape}")
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False)
-    write_supabase_file(rel_xlsx, buf.getvalue())
-
-def _canon(s: str) -> str:
-    # Lower, trim, normalize separators
-    x = (s or "").strip().lower()
-    x = x.replace(" ", "_").replace("-", "_")
-    x = re.sub(r"_+", "_", x)
-    return x
-
-# Suffix patterns:
-#  - Decimal: base_<N>.<M> or base_<N>_<M>
-DEC_RE = re.compile(r"^(?P<base>.+?)[_](?P<maj>\d+)(?:[._-](?P<min>\d+))$")
-#  - Integer: base_<N>   (ensure we didn't already match decimal)
-INT_RE = re.compile(r"^(?P<base>.+?)[_](?P<num>\d+)$")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📥 Downloading (abs): {abs_path}")
+    tmp = tempfile.NamedTemporaryFile(suffix=os.path.splitext(rel_path)[1])
+    try:
+        for chunk in read_supabase_file_stream(abs_path, absolute=True):
+            tmp.write(chunk)
+        tmp.flush()
+    except Exception:
+        tmp.close()
+        raise
+    return tmp
+
+def _calamine_cell(v: Any) -> Any:
+    # Match openpyxl values: calamine reports empty cells as "", whole numbers as float
+    # and midnight datetimes as plain dates
+    if v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return datetime.combine(v, datetime.min.time())
+    return v
+
+def _openpyxl_cell(v: Any) -> Any:
+    # Match calamine values: openpyxl leaves xlsxwriter's _xHHHH_ control-character escapes in strings
+    return xml_unescape(v) if isinstance(v, str) and "_x" in v else v
+
+def _header_and_first_row(rows) -> Tuple[Any, Any]:
+    headers = next(rows, None) or ()
+    values = next((r for r in rows if any(v is not None for v in r)), None)
+    return headers, values
+
+def read_first_row(path: str) -> Dict[Any, Any]:
+    # Header + first non-blank data row of the first sheet. Returns {} when there are no data rows.
+    # Calamine loads the whole sheet before yielding a row, so it's only used for small files
+    # (the common one-row input, where it's fastest); larger files use openpyxl read_only,
+    # whose row iterator does stop after the first data row.
+    if CalamineWorkbook is not None and os.path.getsize(path) <= CALAMINE_FIRST_ROW_MAX_BYTES:
+        sheet = CalamineWorkbook.from_path(path).get_sheet_by_index(0)
+        rows = ([_calamine_cell(v) for v in r] for r in sheet.iter_rows())
+        headers, values = _header_and_first_row(rows)
+    else:
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = ([_openpyxl_cell(v) for v in r] for r in wb.worksheets[0].iter_rows(values_only=True))
+            headers, values = _header_and_first_row(rows)
+        finally:
+            wb.close()
+    if values is None:
+        return {}
+    row0 = {h: v for h, v in zip(headers, values) if h is not None}
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📄 Input first row: {len(row0)} columns. First 5 headers: {list(row0)[:5]}")
+    return row0
+
+def read_xlsx(path: str) -> pd.DataFrame:
+    # Full-sheet parse; only needed for pass-through files
+    return pd.read_excel(path, engine=XLSX_READ_ENGINE)
+
+def _xlsx_cell(v: Any) -> Any:
+    # openpyxl rejects XML control characters (e.g. \x0b); escape them as _xHHHH_ like xlsxwriter does
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, str):
+        return ILLEGAL_CHARACTERS_RE.sub(lambda m: f"_x{ord(m.group()):04X}_", v)
+    return v
+
+def _write_xlsx(df: pd.DataFrame, buf) -> None:
+    # Write-only workbook streams rows straight to the zip instead of building the full cell DOM
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([_xlsx_cell(str(c)) for c in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        ws.append([_xlsx_cell(v) for v in row])
+    wb.save(buf)
+
+def output_rel_path(rel_path: str) -> str:
+    # Output keeps the input's name with the extension swapped for OUT_FORMAT
+    base, _ext = os.path.splitext(_as_rel(rel_path))
+    return f"{base}.{OUT_FORMAT}"
+
+def serialize_output(df: pd.DataFrame):
+    # Serializes `df` as OUT_FORMAT into a rewound temp file
+    out = tempfile.TemporaryFile()
+    try:
+        if OUT_FORMAT == "csv":
+            df.to_csv(out, index=False)
+        elif OUT_FORMAT == "parquet":
+            df.to_parquet(out, engine="pyarrow", compression="zstd", index=False)
+        else:
+            _write_xlsx(df, out)
+        out.seek(0)
+    except Exception:
+        out.close()
+        raise
+    return out
+
+def upload_output(rel_out: str, payload) -> str:
+    # Streams the serialized file to storage and closes it; returns the rel path written
+    with payload:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📤 Uploading {OUT_FORMAT.upper()} (rel): {rel_out}")
+        write_supabase_file(rel_out, payload)
+    return rel_out
+
+def add_to_bundle(bundle: zipfile.ZipFile, rel_out: str, payload) -> str:
+    # Bundle counterpart of upload_output(): copies the serialized file into the run's zip
+    # and closes it. xlsx/parquet are already compressed, so only csv members are deflated.
+    info = zipfile.ZipInfo(os.path.relpath(rel_out, OUTPUT_DIR_REL), datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if OUT_FORMAT == "csv" else zipfile.ZIP_STORED
+    with payload, bundle.open(info, "w") as dst:
+        shutil.copyfileobj(payload, dst)
+    return rel_out
+
+def write_output_to_supabase(df: pd.DataFrame, rel_path: str) -> str:
+    # Serializes `df` as OUT_FORMAT (extension replaced accordingly); returns the rel path written
+    rel_out = output_rel_path(rel_path)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"💾 Writing {OUT_FORMAT.upper()} (rel): {rel_out} with shape {df.shape}")
+    return upload_output(rel_out, serialize_output(df))
+
+def _is_canonical(h: Any) -> bool:
+    # Already lower_snake_case: canonicalizing would return it unchanged
+    return (
+        isinstance(h, str) and h.islower() and h == h.strip()
+        and " " not in h and "-" not in h and "__" not in h
+    )
+
+@lru_cache(maxsize=256)
+def _canon_tuple(headers: Tuple[Any, ...]) -> Tuple[str, ...]:
+    # Fast path: the common all-canonical header row skips the string kernels entirely
+    if all(_is_canonical(h) for h in headers):
+        return headers
+    # Lower, trim, normalize separators — one vectorized pass over all headers
+    # (Arrow string kernels when pyarrow is available) instead of per-key Python calls
+    idx = pd.Index(["" if h is None else str(h) for h in headers], dtype=STRING_DTYPE)
+    idx = idx.str.strip().str.lower()
+    # One regex pass: any run of spaces/hyphens/underscores collapses to a single "_"
+    idx = idx.str.replace(r"[ _\-]+", "_", regex=True)
+    return tuple(idx.tolist())
+
+def _canon_headers(headers) -> Tuple[str, ...]:
+    # Memoized per header row: the suffix check and the transform canonicalize the same
+    # row back to back, and input files typically share one header layout
+    return _canon_tuple(tuple(headers))
+
+# Suffix pattern (one regex, one match call per header):
+#  - Decimal: base_<N>.<M> or base_<N>_<M>  → "min" group set
+#  - Integer: base_<N>                      → "min" group is None
+# The lazy base tries the decimal split first, so e.g. "x_1_2" is decimal (1.2), not integer 2.
+SUFFIX_RE = re.compile(r"^(?P<base>.+?)_(?P<maj>\d+)(?:[._-](?P<min>\d+))?$")
+
+# Per canonical header: (base, major, minor-or-None) when suffixed, else None
+HeaderSuffix = Optional[Tuple[str, int, Optional[int]]]
+
+@lru_cache(maxsize=256)
+def _suffix_tuple(canon: Tuple[str, ...]) -> Tuple[HeaderSuffix, ...]:
+    parsed = []
+    for h in canon:
+        m = SUFFIX_RE.match(h)
+        if m is None:
+            parsed.append(None)
+        else:
+            min_str = m.group("min")
+            parsed.append((m.group("base"), int(m.group("maj")), None if min_str is None else int(min_str)))
+    return tuple(parsed)
+
+def _parse_headers(headers) -> Tuple[Tuple[str, ...], Tuple[HeaderSuffix, ...]]:
+    # Canonical headers + their suffix parse, both memoized per header row: the suffix check
+    # and the transform share one regex pass, as do files with the same layout
+    canon = _canon_headers(headers)
+    return canon, _suffix_tuple(canon)
+
+def _has_numeric_suffix(headers) -> bool:
+    # Header-only scan: True if any canonical header carries a _N or _N.M suffix
+    return any(p is not None for p in _parse_headers(headers)[1])
 
 # -----------------------------------------------------------
 # Core Transform — suffix-driven only
 # -----------------------------------------------------------
 
-def transform_by_suffix(df: pd.DataFrame) -> pd.DataFrame:
-    if df.shape[0] == 0:
+def transform_by_suffix(row0: Dict[Any, Any]) -> pd.DataFrame:
+    # `row0` is the sheet's first data row as {header: value}; see read_first_row()
+    if not row0:
         return pd.DataFrame()
 
-    row0 = df.iloc[0].to_dict()
-    # Canonicalize headers
-    items = [(_canon(k), v) for k, v in row0.items()]
-
     globals_map: Dict[str, Any] = {}          # no suffix
     sections: Dict[int, Dict[str, Any]] = {}  # int suffix
-    subs: Dict[int, Dict[str, Dict[str, Any]]] = {}  # N -> { "N.M": {base: val} }
-
-    # Track first-seen order for columns
-    order_global: List[str] = []
-    order_sec: List[str] = []
-    order_sub: List[str] = []
-
-    def _remember(order_list: List[str], key: str):
-        if key not in order_list:
-            order_list.append(key)
-
-    for k, v in items:
-        m_dec = DEC_RE.match(k)
-        if m_dec:
-            base = m_dec.group("base")
-            maj = int(m_dec.group("maj"))
-            min_ = int(m_dec.group("min"))
-            snum = f"{maj}.{min_}"
-            subs.setdefault(maj, {}).setdefault(snum, {})[base] = v
-            _remember(order_sub, base)
-            continue
-
-        m_int = INT_RE.match(k)
-        if m_int:
-            base = m_int.group("base")
-            num = int(m_int.group("num"))
-            sections.setdefault(num, {})[base] = v
-            _remember(order_sec, base)
+    subs: Dict[int, Dict[Tuple[int, int], Dict[str, Any]]] = {}  # N -> { (N, M): {base: val} }
+
+    # Track first-seen order for columns: insertion-ordered dicts used as ordered sets,
+    # so dedup is O(1) per key (globals_map already is one for the globals)
+    order_sec: Dict[str, None] = {}
+    order_sub: Dict[str, None] = {}
+
+    # Single pass over the row: classify each (canonical header, value) pair
+    canon, parsed = _parse_headers(row0)
+    for k, p, v in zip(canon, parsed, row0.values()):
+        if p is not None:
+            base, maj, minor = p
+            if minor is not None:
+                subs.setdefault(maj, {}).setdefault((maj, minor), {})[base] = v
+                order_sub[base] = None
+            else:
+                sections.setdefault(maj, {})[base] = v
+                order_sec[base] = None
             continue
 
         # No suffix → global
         globals_map[k] = v
-        _remember(order_global, k)
-
-    # ✅ NEW: Pass-through when there are no numeric suffixes at all
-    if not sections and not subs:
-        logger.info("ℹ️ No numeric suffixes detected; writing pass-through (input == output).")
-        return df.copy()
 
     # Collision handling: base name appears in both section & sub buckets
-    sec_bases = set(order_sec)
-    sub_bases = set(order_sub)
-    overlap = sec_bases & sub_bases
-
-    sec_out_cols = []
-    sub_out_cols = []
-    # Map output column -> source base
-    sec_out_map: Dict[str, str] = {}
-    sub_out_map: Dict[str, str] = {}
-
-    for b in order_sec:
-        col = f"section_{b}" if b in overlap else b
-        sec_out_cols.append(col)
-        sec_out_map[col] = b
-
-    for b in order_sub:
-        col = f"sub_section_{b}" if b in overlap else b
-        sub_out_cols.append(col)
-        sub_out_map[col] = b
+    overlap = order_sec.keys() & order_sub.keys()
+
+    # Output column names, positionally aligned with order_sec / order_sub
+    sec_out_cols = [f"section_{b}" if b in overlap else b for b in order_sec]
+    sub_out_cols = [f"sub_section_{b}" if b in overlap else b for b in order_sub]
 
     # Assemble final column order
     columns = []
-    columns.extend(order_global)            # globals, e.g. report_change, report_title, etc.
+    columns.extend(globals_map)             # globals, e.g. report_change, report_title, etc.
     columns.append("section_number")
     columns.extend(sec_out_cols)
     columns.append("sub_section_number")
     columns.extend(sub_out_cols)
 
-    # Build rows
-    out_rows: List[Dict[str, Any]] = []
-    section_nums = sorted(sections.keys())
-    logger.info(f"🔎 Suffix-based detection → sections: {section_nums or 'NONE'} | has_subs_for: {sorted(list(subs.keys())) or 'NONE'}")
+    # Build the frame column-wise (one list per output column, in `columns` order)
+    section_nums = sorted(sections)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"🔎 Suffix-based detection → sections: {section_nums or 'NONE'} | has_subs_for: {sorted(subs) or 'NONE'}")
 
     if not section_nums and subs:
         # There are sub-sections but no explicit section_*_N keys: infer sections from subs' majors
-        section_nums = sorted(subs.keys())
-
-    for sec_num in section_nums:
+        section_nums = sorted(subs)
+
+    # Rows per section: one per sub-section, or a single row when it has none
+    sec_counts = [len(subs.get(sec_num, ())) or 1 for sec_num in section_nums]
+    n_rows = sum(sec_counts)
+
+    sec_num_col: List[int] = []
+    sec_cols: List[List[Any]] = [[] for _ in order_sec]
+    # Sub columns start fully blank in one allocation each; only sub-rows are filled in,
+    # so section-only rows cost nothing per sub column
+    sub_num_col: List[Any] = [None] * n_rows
+    sub_cols: List[List[Any]] = [[None] * n_rows for _ in order_sub]
+    sub_col_of = {b: col for b, col in zip(order_sub, sub_cols)}  # base -> its output column
+
+    row = 0
+    for sec_num, n in zip(section_nums, sec_counts):
         sec_fields = sections.get(sec_num, {})
-        sub_map = subs.get(sec_num, {})
+        sub_map = subs.get(sec_num)
 
         if sub_map:
-            for sub_num_str in sorted(sub_map.keys(), key=lambda s: (int(s.split(".")[0]), int(s.split(".")[1]))):
-                sub_fields = sub_map[sub_num_str]
-                rec: Dict[str, Any] = {}
-
-                # Globals repeated
-                for g in order_global:
-                    rec[g] = globals_map.get(g)
-
-                rec["section_number"] = int(sec_num)
-
-                # Section fields
-                for col in sec_out_cols:
-                    base = sec_out_map[col]
-                    rec[col] = sec_fields.get(base)
+            # Each section's sub-map is sorted exactly once, as (key, fields) items:
+            # (major, minor) int tuples sort natively — no key function, no re-lookup
+            for i, (sub_key, sub_fields) in enumerate(sorted(sub_map.items()), start=row):
+                sub_num_col[i] = float(f"{sub_key[0]}.{sub_key[1]}")
+                # Columns are pre-blanked, so only the fields this sub-section has are written
+                for b, v in sub_fields.items():
+                    sub_col_of[b][i] = v
+        row += n
+
+        # Section values repeat on each of the section's rows
+        sec_num_col.extend([sec_num] * n)
+        for col, b in zip(sec_cols, order_sec):
+            col.extend([sec_fields.get(b)] * n)
+
+    # Globals repeat on every row
+    data: List[List[Any]] = [[g_val] * n_rows for g_val in globals_map.values()]
+    data.append(sec_num_col)
+    data.extend(sec_cols)
+    data.append(sub_num_col)
+    data.extend(sub_cols)
+
+    # Keyed by position so colliding column names (see below) survive construction
+    out_df = pd.DataFrame(dict(enumerate(data)), copy=False)
+    out_df.columns = columns
+
+    # Explicit dtypes: nullable numbers for the keys, Arrow-backed strings for all-text columns
+    # (skipped when a global header collides with a generated column name). Global and section
+    # text repeats on every row of its section, so those columns are categorical: one copy per
+    # distinct value instead of one per row (and dictionary-encoded in parquet output).
+    if out_df.columns.is_unique:
+        repeated = set(globals_map).union(sec_out_cols)
+        dtypes = dict(KEY_DTYPES)
+        if section_nums and section_nums[-1] > INT64_MAX:
+            # Suffix too large for Int64 (e.g. a long numeric ID in a header): keep it untyped
+            del dtypes["section_number"]
+        for c in columns:
+            if c in KEY_DTYPES:
+                continue
+            kind = pd.api.types.infer_dtype(out_df[c], skipna=True)
+            if kind == "string" and c in repeated:
+                dtypes[c] = "category"
+            elif kind in ("string", "empty"):
+                dtypes[c] = STRING_DTYPE
+        out_df = out_df.astype(dtypes)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"🧮 Built rows: {len(out_df)} | columns: {len(columns)}")
+    return out_df
 
-                # Sub fields
-                rec["sub_section_number"] = float(sub_num_str)
-                for col in sub_out_cols:
-                    base = sub_out_map[col]
-                    rec[col] = sub_fields.get(base)
+# -----------------------------------------------------------
+# Run manifest — {input name: {"updated_at", "format", "bundle", "output"}}
+# -----------------------------------------------------------
 
-                out_rows.append(rec)
-        else:
-            # Section without sub-rows => single row with blank sub fields
-            rec = {}
-            for g in order_global:
-                rec[g] = globals_map.get(g)
-            rec["section_number"] = int(sec_num)
-            for col in sec_out_cols:
-                base = sec_out_map[col]
-                rec[col] = sec_fields.get(base)
-            rec["sub_section_number"] = pd.NA
-            for col in sub_out_cols:
-                rec[col] = pd.NA
-            out_rows.append(rec)
-
-    out_df = pd.DataFrame(out_rows, columns=columns)
-    logger.info(f"🧮 Built rows: {len(out_df)} | columns: {len(columns)}")
-    return out_df
+def load_manifest() -> Dict[str, Dict[str, Any]]:
+    # A missing manifest (first run) is not an error: everything is processed
+    try:
+        text = read_supabase_file(MANIFEST_REL, missing_ok=True)
+        manifest = json.loads(text) if text else {}
+    except Exception as ex:
+        logger.warning(f"⚠️ Failed to load manifest {MANIFEST_REL}; processing all inputs. ({ex})")
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def save_manifest(manifest: Dict[str, Dict[str, Any]]) -> None:
+    # Best effort: a failed save only means the next run reprocesses those inputs
+    try:
+        write_supabase_file(MANIFEST_REL, json.dumps(manifest, indent=2, sort_keys=True), content_type="application/json")
+    except Exception as ex:
+        logger.warning(f"⚠️ Failed to save manifest {MANIFEST_REL}: {ex}")
+
+def _is_unchanged(prev: Optional[Dict[str, Any]], updated_at: Optional[str]) -> bool:
+    # A different format or bundle mode means the expected output object doesn't exist yet
+    return bool(
+        prev and updated_at and prev.get("updated_at") == updated_at
+        and prev.get("format") == OUT_FORMAT and prev.get("bundle", False) == BUNDLE_OUTPUTS
+    )
 
 # -----------------------------------------------------------
 # Orchestration
 # -----------------------------------------------------------
 
-def process_single_file(filename: str) -> Tuple[str, bool, str]:
+def build_output(filename: str) -> Tuple[Optional[pd.DataFrame], str]:
+    # Fetch → parse → transform stages for one input file.
+    # Returns (df, "") or (None, skip reason) when there is nothing to write.
     in_rel = f"{INPUT_DIR_REL}{filename}"
-    out_rel = f"{OUTPUT_DIR_REL}{filename}"
-
-    logger.info(f"📥 Reading XLSX (rel): {in_rel}")
-    df_in = read_xlsx_from_supabase(in_rel)
 
-    logger.info("🔧 Transforming via suffix-only logic...")
-    df_out = transform_by_suffix(df_in)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📥 Reading XLSX (rel): {in_rel}")
+    with download_xlsx_from_supabase(in_rel) as src:
+        row0 = read_first_row(src.name)
+        if not row0:
+            logger.warning(f"⏭️ Skipping write for '{filename}': no data rows.")
+            return (None, "no rows")
+
+        # Pass-through when there are no numeric suffixes at all — decided from the headers
+        # alone; only this case needs every row, so only it parses the full sheet
+        if not _has_numeric_suffix(row0):
+            logger.info("ℹ️ No numeric suffixes detected; writing pass-through (input == output).")
+            df_out = read_xlsx(src.name)
+        else:
+            logger.debug("🔧 Transforming via suffix-only logic...")
+            df_out = transform_by_suffix(row0)
 
     if df_out.shape[0] == 0:
         logger.warning(f"⏭️ Skipping write for '{filename}': no rows built.")
-        return (filename, False, "no rows")
-
-    logger.info(f"📤 Writing XLSX (rel): {out_rel}")
-    write_xlsx_to_supabase(df_out, out_rel)
-
-    logger.info(f"✅ Done: {out_rel}")
-    return (filename, True, "")
+        return (None, "no rows")
+    return (df_out, "")
+
+def process_single_file(filename: str, uploader: Optional[ThreadPoolExecutor] = None, upload=upload_output) -> Tuple[str, bool, Any]:
+    # Returns (filename, wrote, detail): detail is the written rel path, or the skip reason.
+    # With `uploader`, the upload stage is handed off and detail is a Future of the rel path,
+    # so the calling worker is free to fetch the next file while this one uploads.
+    # `upload(rel_out, payload)` is the final stage (upload_output, or add_to_bundle).
+    df_out, reason = build_output(filename)
+    if df_out is None:
+        return (filename, False, reason)
+
+    rel_out = output_rel_path(f"{OUTPUT_DIR_REL}{filename}")
+    payload = serialize_output(df_out)
+    del df_out
+
+    if uploader is not None:
+        return (filename, True, uploader.submit(upload, rel_out, payload))
+
+    written_rel = upload(rel_out, payload)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"✅ Done: {written_rel}")
+    return (filename, True, written_rel)
 
 def process_all_files() -> Dict[str, Any]:
-    entries = list_folder(LIST_DIR_ABS)
     written, skipped = [], []
-
-    for e in entries:
-        name = e.get("name")
-        if not name or name.endswith("/"):
-            continue
-        if not name.lower().endswith((".xlsx", ".xls")):
-            logger.info(f"⏭️ Skipping non-Excel file: {name}")
-            continue
-
-        try:
-            fname, did_write, reason = process_single_file(name)
-            if did_write:
-                written.append(f"{OUTPUT_DIR_REL}{fname}")
-            else:
-                skipped.append({"file": fname, "reason": reason})
-        except Exception as ex:
-            logger.error(f"❌ Failed to process '{name}': {ex}")
-            skipped.append({"file": name, "reason": str(ex)})
-
-    return {"written": written, "count": len(written), "skipped": skipped}
+    manifest = load_manifest() if SKIP_UNCHANGED else {}
+    stamps: Dict[str, Optional[str]] = {}  # submitted input -> listing updated_at
+    listed = set()                          # Excel inputs present in this listing
+
+    # Bundle mode: outputs are appended to one temp zip by a single upload worker (so zip
+    # writes never interleave) and the zip is uploaded once after every file is collected
+    bundle = zipfile.ZipFile(tempfile.TemporaryFile(), "w") if BUNDLE_OUTPUTS else None
+    upload = partial(add_to_bundle, bundle) if bundle else upload_output
+
+    # Files are I/O-bound and independent: submit each as soon as its listing page
+    # arrives, then collect in listing order so the result payload stays deterministic.
+    # Uploads run on their own pool so network writes overlap the next files' downloads
+    # and parsing instead of holding a worker.
+    with ThreadPoolExecutor(max_workers=1 if bundle else UPLOAD_WORKERS) as uploads, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {}
+        for e in list_folder(LIST_DIR_ABS):
+            name = e.get("name")
+            if not name or name.endswith("/"):
+                continue
+            if not name.lower().endswith(EXCEL_EXTS):
+                logger.info(f"⏭️ Skipping non-Excel file: {name}")
+                continue
+            listed.add(name)
+            size = (e.get("metadata") or {}).get("size")
+            if size is not None and size < MIN_INPUT_BYTES:
+                logger.warning(f"⏭️ Skipping '{name}' without download: {size} bytes is too small to hold data.")
+                skipped.append({"file": name, "reason": f"too small ({size} bytes)"})
+                continue
+            updated_at = e.get("updated_at")
+            if SKIP_UNCHANGED and _is_unchanged(manifest.get(name), updated_at):
+                logger.info(f"⏭️ Skipping '{name}' without download: unchanged since last run.")
+                skipped.append({"file": name, "reason": "unchanged since last run"})
+                continue
+            stamps[name] = updated_at
+            futures[pool.submit(process_single_file, name, uploads, upload)] = name
+
+        for fut, name in futures.items():
+            try:
+                fname, did_write, detail = fut.result()
+                if did_write:
+                    detail = detail.result()
+                    written.append(detail)
+                else:
+                    skipped.append({"file": fname, "reason": detail})
+                # Written and no-rows inputs are both settled until they change; failures retry.
+                # In bundle mode the output is re-pointed at the zip once it's uploaded (below).
+                manifest[name] = {
+                    "updated_at": stamps[name], "format": OUT_FORMAT, "bundle": BUNDLE_OUTPUTS,
+                    "output": detail if did_write else None,
+                }
+            except Exception as ex:
+                logger.error(f"❌ Failed to process '{name}': {ex}")
+                skipped.append({"file": name, "reason": str(ex)})
+
+    result = {"written": written, "count": len(written), "skipped": skipped}
+
+    if bundle is not None:
+        # Only the zip is uploaded, so it alone is `written`; its member paths go under
+        # `bundle_members`. Nothing is uploaded when no file produced output.
+        fh = bundle.fp
+        bundle.close()
+        result.update({"written": [], "count": 0, "bundle": None, "bundle_members": written})
+        with fh:
+            if written:
+                bundle_rel = f"{OUTPUT_DIR_REL}batch_{datetime.now().strftime('%d-%m-%Y_%H-%M-%S')}.zip"
+                fh.seek(0)
+                logger.info(f"📦 Uploading {len(written)} outputs as one bundle: {bundle_rel}")
+                write_supabase_file(bundle_rel, fh, content_type="application/zip")
+                result.update({"written": [bundle_rel], "count": 1, "bundle": bundle_rel})
+                for name in stamps:
+                    if manifest.get(name, {}).get("output"):
+                        manifest[name]["output"] = bundle_rel
+
+    # Saved last, so inputs are only marked done once their outputs are actually stored
+    # (entries for inputs no longer listed are dropped)
+    if SKIP_UNCHANGED and (stamps or manifest.keys() - listed):
+        save_manifest({k: v for k, v in manifest.items() if k in listed})
+    return result
 
 def run_prompt(_: dict) -> dict:
     logger.info("🚀 Starting suffix-based formatter")
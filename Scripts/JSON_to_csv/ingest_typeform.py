@@ -1,6 +1,8 @@
 import os
+import codecs
 import requests
 import time
+import tempfile
 import pytz
 from datetime import datetime
 from logger import logger
@@ -17,9 +19,12 @@ logger.info(f"   JSON_FILE_FIELD_ID = {json_file_field_id}")
 logger.info(f"   SUPABASE_ROOT_FOLDER = {SUPABASE_ROOT_FOLDER}")
 logger.info(f"   SUPABASE_URL = {SUPABASE_URL}")
 
+# Shared session for Typeform downloads (connection reuse across retries)
+typeform_session = requests.Session()
+
 # --- HELPERS ---
-def download_file(url: str, retries: int = 3, delay: int = 2) -> bytes:
-    """Downloads a file from a given URL and returns its binary content, with Typeform auth if needed."""
+def download_file(url: str, retries: int = 3, delay: int = 2, chunk_size: int = 64 * 1024):
+    """Streams a file from a given URL into a rewound temp file, with Typeform auth if needed."""
     headers = {}
 
     if "api.typeform.com/responses/files" in url:
@@ -30,15 +35,20 @@ def download_file(url: str, retries: int = 3, delay: int = 2) -> bytes:
 
     for attempt in range(1, retries + 1):
         logger.info(f"🌐 Attempting download (try {attempt}) from URL: {url}")
+        tmp = tempfile.TemporaryFile()
         try:
-            res = requests.get(url, headers=headers, timeout=10)
-            if res.status_code != 200:
-                logger.warning(f"📡 HTTP {res.status_code} - Response headers: {res.headers}")
-                logger.warning(f"📡 Response content preview: {res.content[:200]}")
-            res.raise_for_status()
-            logger.info(f"📥 Download successful (size = {len(res.content)} bytes)")
-            return res.content
+            with typeform_session.get(url, headers=headers, timeout=10, stream=True) as res:
+                if res.status_code != 200:
+                    logger.warning(f"📡 HTTP {res.status_code} - Response headers: {res.headers}")
+                    logger.warning(f"📡 Response content preview: {res.content[:200]}")
+                res.raise_for_status()
+                for chunk in res.iter_content(chunk_size=chunk_size):
+                    tmp.write(chunk)
+            logger.info(f"📥 Download successful (size = {tmp.tell()} bytes)")
+            tmp.seek(0)
+            return tmp
         except requests.RequestException as e:
+            tmp.close()
             logger.warning(f"⚠️ Download failed (attempt {attempt}): {e}")
             if attempt < retries:
                 time.sleep(delay)
@@ -46,6 +56,15 @@ def download_file(url: str, retries: int = 3, delay: int = 2) -> bytes:
                 logger.error(f"❌ Failed to download file after {retries} attempts: {url}")
                 raise
 
+def validate_utf8(f, chunk_size: int = 64 * 1024) -> None:
+    """Raises UnicodeDecodeError unless the rest of binary file `f` is valid UTF-8, decoding chunk by chunk so only one chunk of text exists at a time. Leaves `f` rewound to where it started."""
+    start = f.tell()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        decoder.decode(chunk)
+    decoder.decode(b"", final=True)
+    f.seek(start)
+
 # --- MAIN FUNCTION ---
 def process_typeform_submission(data):
     """Extracts JSON file from Typeform and writes it to Supabase."""
@@ -79,21 +98,21 @@ def process_typeform_submission(data):
 
         # Download file
         logger.info(f"⬇️ Downloading JSON input file from: {json_file_url}")
-        file_data = download_file(json_file_url)
-
-        # Decode and log preview
-        try:
-            decoded_file = file_data.decode("utf-8")
-            logger.info("✅ Decoded JSON file as UTF-8 successfully")
-        except UnicodeDecodeError as e:
-            logger.error(f"❌ Failed to decode file as UTF-8: {e}")
-            raise
+        with download_file(json_file_url) as file_data:
+            # Validate UTF-8 in chunks (no full decoded copy) and log preview
+            try:
+                validate_utf8(file_data)
+                logger.info("✅ Validated JSON file as UTF-8 successfully")
+            except UnicodeDecodeError as e:
+                logger.error(f"❌ Failed to decode file as UTF-8: {e}")
+                raise
 
-        logger.info(f"🔎 File content preview (first 100 chars): {repr(decoded_file[:100])}")
-        logger.info(f"📏 File length (chars): {len(decoded_file)}")
+            preview = file_data.read(100)
+            file_data.seek(0)
+            logger.info(f"🔎 File content preview (first 100 bytes): {preview.decode('utf-8', errors='replace')!r}")
 
-        # Save to Supabase
-        write_supabase_file(file_path, decoded_file)
+            # Save to Supabase — streamed from the temp file
+            write_supabase_file(file_path, file_data)
         logger.info("✅ JSON file written to Supabase successfully.")
 
     except Exception:
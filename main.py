@@ -1,12 +1,27 @@
 from flask import Flask, request, jsonify
 import importlib
-import threading
 import os
+from concurrent.futures import ThreadPoolExecutor
 from logger import logger
 from Scripts.JSON_to_csv.ingest_typeform import process_typeform_submission
 
 app = Flask(__name__)
 
+# --- JSON PROVIDER ---
+# orjson (optional) parses webhook bodies in C; responses keep Flask's default serializer
+# so the wire format (HTTP-date datetimes, ASCII escaping, NaN) is unchanged
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    logger.info("ℹ️ orjson not installed; using Flask's default JSON provider.")
+
 # --- ROUTE CONFIG ---
 RENDER_ENV = os.getenv("RENDER_ENV", "/ingest-typeform")
 if not RENDER_ENV.startswith("/"):
@@ -14,6 +29,11 @@ if not RENDER_ENV.startswith("/"):
 
 logger.info(f"📡 Flask binding RENDER_ENV route: {RENDER_ENV}")
 
+# --- PROMPT EXECUTOR ---
+# Bounded pool for prompt runs: a burst of requests queues instead of spawning a thread each
+PROMPT_WORKERS = int(os.getenv("PROMPT_WORKERS", "16"))
+PROMPT_EXECUTOR = ThreadPoolExecutor(max_workers=PROMPT_WORKERS, thread_name_prefix="prompt")
+
 # --- TYPEFORM INGESTION ROUTE ---
 @app.route(RENDER_ENV, methods=["POST"])
 def dynamic_ingest_typeform():
@@ -69,11 +89,10 @@ def dispatch_prompt():
             except Exception:
                 logger.exception("Background prompt execution failed.")
 
-        thread = threading.Thread(target=run_and_capture)
-        thread.start()
+        future = PROMPT_EXECUTOR.submit(run_and_capture)
 
         if prompt_name in BLOCKING_PROMPTS:
-            thread.join()
+            future.result()
             return jsonify(result_container)
 
         return jsonify({